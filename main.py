@@ -1,8 +1,9 @@
-import sqlite3
+import ntpath
+import re
 import subprocess
 import sys
-import webbrowser
 from pathlib import Path
+from typing import NamedTuple
 
 from flowlauncher import FlowLauncher
 
@@ -12,11 +13,14 @@ paths = (".", "lib", "plugin")
 sys.path = [str(plugindir / p) for p in paths] + sys.path
 
 ZED_DB_PATH = Path.home() / "AppData/Local/Zed/db/0-stable/db.sqlite"
+ZED_WAL_PATH = ZED_DB_PATH.with_name(ZED_DB_PATH.name + "-wal")
+
+_MULTI_SLASH = re.compile(r"/+")
 
 
 def is_wsl_path(p: str) -> bool:
     """Detect whether a path belongs to WSL (only when not an SSH remote)."""
-    return p.startswith("/home/") or p.startswith("/mnt/")
+    return p.startswith(("/home/", "/mnt/"))
 
 
 def build_ssh_uri(
@@ -36,100 +40,171 @@ def build_ssh_uri(
 def normalize(p: str) -> str:
     if not isinstance(p, str):
         return ""
-    s = p.replace("\\", "/")
+    s = _MULTI_SLASH.sub("/", p.replace("\\", "/"))
+    if len(s) > 1 and s[-1] == "/":
+        s = s[:-1]
+    return s.lower()
 
-    while "//" in s:
-        s = s.replace("//", "/")
 
-    if len(s) > 1 and s.endswith("/"):
-        s = s.rstrip("/")
-    return s.lower()
+class Workspace(NamedTuple):
+    """A deduplicated workspace row, with display fields precomputed."""
+
+    id: int
+    path: str
+    path_lower: str
+    normalized: str
+    name: str
+    name_lower: str
+    is_wsl: bool
+    is_ssh: bool
+    ssh_host: str | None = None
+    ssh_user: str | None = None
+    ssh_port: int | None = None
 
 
 class ZedWorkspaceSearch(FlowLauncher):
+    def __init__(self):
+        # Parsed workspaces, keyed by the DB file's mtime
+        self._cache = None
+        self._cache_mtime = None
+        # Read-only DB connection, kept open so SQLite reuses its compiled query
+        self._con = None
+        self._con_immutable = False
+        super().__init__()
+
+    def _connection(self):
+        # An immutable connection never sees later writes, so don't reuse it
+        if self._con is not None and self._con_immutable:
+            self._con.close()
+            self._con = None
+
+        if self._con is None:
+            # Only queries read the DB; launches shouldn't pay for importing it
+            import sqlite3
+
+            # Read-only, so no write locks against the live database Zed
+            # holds open. A read-only open of a WAL database creates -wal and
+            # -shm files it can't remove, so when Zed is closed (no WAL to
+            # miss) open it immutable instead, which touches nothing
+            immutable = not ZED_WAL_PATH.exists()
+            uri = f"{ZED_DB_PATH.as_uri()}?mode=ro"
+            if immutable:
+                uri += "&immutable=1"
+            con = sqlite3.connect(uri, uri=True)
+            # Stored before setup so a failure below is closed by the caller
+            self._con = con
+            self._con_immutable = immutable
+            con.execute("PRAGMA query_only=1")
+            con.execute("PRAGMA temp_store=MEMORY")
+            # Deterministic only permits constant folding and index use; the
+            # MATERIALIZED CTE is what limits it to one call per row
+            con.create_function("normalize", 1, normalize, deterministic=True)
+        return self._con
+
+    def _db_mtime(self):
+        """Latest mtime of the DB and its WAL; Zed's writes land in the WAL first."""
+        mtime = ZED_DB_PATH.stat().st_mtime_ns
+        try:
+            return max(mtime, ZED_WAL_PATH.stat().st_mtime_ns)
+        except OSError:
+            return mtime
+
     def _load_workspaces(self):
-        if not ZED_DB_PATH.exists():
+        try:
+            mtime = self._db_mtime()
+        except OSError:
             return []
 
+        if self._cache is not None and mtime == self._cache_mtime:
+            return self._cache
+
         try:
-            con = sqlite3.connect(ZED_DB_PATH)
-            cur = con.cursor()
-
-            # JOIN with remote_connections to get SSH info
-            cur.execute("""
-                SELECT 
-                    w.workspace_id, 
-                    w.paths,
-                    rc.kind,
-                    rc.host,
-                    rc.port,
-                    rc.user
-                FROM workspaces w
-                LEFT JOIN remote_connections rc ON w.remote_connection_id = rc.id
+            # JOIN with remote_connections to get SSH info, keeping only the
+            # shortest (then earliest) path for each normalized path
+            cur = self._connection().execute("""
+                -- MATERIALIZED so normalize() runs once per row, rather than
+                -- once for PARTITION BY and again for the projected column
+                WITH candidates AS MATERIALIZED (
+                    SELECT
+                        w.workspace_id,
+                        w.paths,
+                        normalize(w.paths) AS normalized,
+                        CASE
+                            WHEN rc.kind = 'ssh' AND rc.host IS NOT NULL
+                            THEN 1 ELSE 0
+                        END AS is_ssh,
+                        rc.host,
+                        rc.port,
+                        rc.user
+                    FROM workspaces w
+                    LEFT JOIN remote_connections rc
+                        ON w.remote_connection_id = rc.id
+                    WHERE typeof(w.paths) = 'text' AND w.paths <> ''
+                )
+                SELECT
+                    workspace_id,
+                    paths,
+                    normalized,
+                    -- Only consider WSL if NOT an SSH remote
+                    CASE
+                        WHEN NOT is_ssh
+                            AND (paths GLOB '/home/*' OR paths GLOB '/mnt/*')
+                        THEN 1 ELSE 0
+                    END AS is_wsl,
+                    is_ssh,
+                    CASE WHEN is_ssh THEN host END AS host,
+                    CASE WHEN is_ssh THEN user END AS user,
+                    CASE WHEN is_ssh THEN port END AS port
+                FROM (
+                    SELECT
+                        *,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY normalized
+                            ORDER BY LENGTH(paths), workspace_id
+                        ) AS rn
+                    FROM candidates
+                )
+                WHERE rn = 1
             """)
-            rows = cur.fetchall()
-            con.close()
-
-            by_normalized = {}
-            by_workspace_id = {}
-
-            for wid, path, rc_kind, rc_host, rc_port, rc_user in rows:
-                if not path or not isinstance(path, str):
-                    continue
-
-                norm = normalize(path)
-
-                # Determine connection type
-                is_ssh = rc_kind == "ssh" and rc_host is not None
-                # Only consider WSL if NOT an SSH remote
-                is_wsl = not is_ssh and is_wsl_path(path)
-
-                workspace_data = {
-                    "id": wid,
-                    "path": path,
-                    "normalized": norm,
-                    "is_wsl": is_wsl,
-                    "is_ssh": is_ssh,
-                    "ssh_host": rc_host if is_ssh else None,
-                    "ssh_user": rc_user if is_ssh else None,
-                    "ssh_port": rc_port if is_ssh else None,
-                }
 
-                # If we've already seen this normalized path, prefer the earliest record
-                if norm not in by_normalized:
-                    by_normalized[norm] = workspace_data
-                else:
-                    existing = by_normalized[norm]["path"]
-                    if len(path) < len(existing):
-                        by_normalized[norm] = workspace_data
-
-                # track shortest path per workspace_id as fallback
-                if wid not in by_workspace_id or len(path) < len(
-                    by_workspace_id[wid]["path"]
-                ):
-                    by_workspace_id[wid] = workspace_data
-
-            # Prefer the normalized-set
-            results = (
-                list(by_normalized.values())
-                if by_normalized
-                else list(by_workspace_id.values())
-            )
+            results = []
+
+            for wid, path, norm, is_wsl, is_ssh, host, user, port in cur:
+                # Last path component with Path.name semantics: drive and UNC
+                # share roots have none. ntpath keeps a trailing separator as
+                # an empty component, so strip those first
+                base = ntpath.basename(path.rstrip("/\\")).lower()
+
+                results.append(
+                    Workspace(
+                        wid,
+                        path,
+                        path.lower(),
+                        norm,
+                        base.capitalize() or path,
+                        base,
+                        bool(is_wsl),
+                        bool(is_ssh),
+                        host,
+                        user,
+                        port,
+                    )
+                )
 
             # Sort results
-            results.sort(key=lambda r: Path(r["path"]).name.lower())
+            results.sort(key=lambda r: r.name_lower)
 
+            self._cache = results
+            self._cache_mtime = mtime
             return results
 
         except Exception as e:
-            return [
-                {
-                    "id": -1,
-                    "path": f"<Error reading DB: {e}>",
-                    "is_wsl": False,
-                    "is_ssh": False,
-                }
-            ]
+            # Start over with a fresh connection on the next load
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            error = f"<Error reading DB: {e}>"
+            return [Workspace(-1, error, error.lower(), "", error, "", False, False)]
 
     def query(self, query):
         q = query.lower().strip()
@@ -144,94 +219,72 @@ class ZedWorkspaceSearch(FlowLauncher):
                 }
             ]
 
-        filtered = (
-            [w for w in workspaces if q in w["path"].lower()] if q else workspaces
-        )
+        filtered = [w for w in workspaces if q in w.path_lower] if q else workspaces
 
         results = []
         for w in filtered:
-            # Use the path's last part for name, capitalize it
-            try:
-                name = Path(w["path"]).name or w["path"]
-                # Capitalize the project name
-                name = name.capitalize() if name else name
-            except Exception:
-                name = w["path"]
+            # The DB error row has nothing to open
+            if w.id == -1:
+                results.append(
+                    {
+                        "Title": w.name,
+                        "SubTitle": str(ZED_DB_PATH),
+                        "IcoPath": "assets/zed.png",
+                    }
+                )
+                continue
+
+            name = w.name
 
             # Label SSH and WSL workspaces clearly
-            if w.get("is_ssh"):
-                ssh_host = w.get("ssh_host", "remote")
-                title = f"{name} (SSH: {ssh_host})"
-            elif w.get("is_wsl"):
+            if w.is_ssh:
+                title = f"{name} (SSH: {w.ssh_host})"
+            elif w.is_wsl:
                 title = f"{name} (WSL)"
             else:
                 title = name
 
+            # Both slots take the same arguments; share one list
+            ctx = [w.path, w.is_ssh, w.ssh_host, w.ssh_user, w.ssh_port]
             results.append(
                 {
                     "Title": title,
-                    "SubTitle": w["path"],
+                    "SubTitle": w.path,
                     "IcoPath": "assets/zed.png",
                     "JsonRPCAction": {
                         "method": "open_workspace",
-                        "parameters": [
-                            w["path"],
-                            w.get("is_ssh", False),
-                            w.get("ssh_host"),
-                            w.get("ssh_user"),
-                            w.get("ssh_port"),
-                        ],
+                        "parameters": ctx,
                     },
-                    "ContextData": [
-                        w["path"],
-                        w.get("is_ssh", False),
-                        w.get("ssh_host"),
-                        w.get("ssh_user"),
-                        w.get("ssh_port"),
-                    ],
+                    "ContextData": ctx,
                 }
             )
 
-        unique = []
-        seen = set()
-        for r in results:
-            key = (r["Title"].strip().lower(), r["SubTitle"].strip().lower())
-            if key not in seen:
-                seen.add(key)
-                unique.append(r)
+        return results
 
-        return unique
+    def _launch_argv(self, path, is_ssh, ssh_host, ssh_user, ssh_port):
+        """Command line opening path in Zed in the matching environment."""
+        # Open inside WSL, where "zed" is resolved by the distribution
+        if not (is_ssh and ssh_host) and is_wsl_path(path):
+            return ["wsl", "zed", path]
 
-    def open_workspace(
-        self, path, is_ssh=False, ssh_host=None, ssh_user=None, ssh_port=None
-    ):
+        # Resolved here rather than at import: only launches need it
+        import shutil
+
+        zed = shutil.which("zed") or "zed"
         # SSH remote - use zed ssh://[user@]host[:port]/path
         if is_ssh and ssh_host:
-            ssh_uri = build_ssh_uri(ssh_host, path, ssh_user, ssh_port)
-            subprocess.Popen(
-                ["zed", ssh_uri],
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-            )
-            return
-
-        if is_wsl_path(path):
-            # Open inside WSL
-            subprocess.Popen(
-                ["wsl", "zed", path],
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-            )
-            return
-
+            return [zed, build_ssh_uri(ssh_host, path, ssh_user, ssh_port)]
         # Normal Windows path
-        p = Path(path)
-        if p.exists():
-            subprocess.Popen(
-                ["zed", str(p)], shell=False, creationflags=subprocess.CREATE_NO_WINDOW
-            )
-        else:
-            webbrowser.open("file:///")
+        return [zed, path]
+
+    def open_workspace(
+        self, path, is_ssh=False, ssh_host=None, ssh_user=None, ssh_port=None
+    ):
+        subprocess.Popen(
+            self._launch_argv(path, is_ssh, ssh_host, ssh_user, ssh_port),
+            shell=False,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+        )
 
     def context_menu(self, data):
         path = data[0]
@@ -263,26 +316,11 @@ class ZedWorkspaceSearch(FlowLauncher):
         self, path, is_ssh=False, ssh_host=None, ssh_user=None, ssh_port=None
     ):
         """Open workspace using the appropriate environment."""
-        # SSH remote
-        if is_ssh and ssh_host:
-            ssh_uri = build_ssh_uri(ssh_host, path, ssh_user, ssh_port)
-            subprocess.Popen(
-                ["zed", ssh_uri],
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-            )
-            return
-
-        if is_wsl_path(path):
-            subprocess.Popen(
-                ["wsl", "zed", path],
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-            )
-        else:
-            subprocess.Popen(
-                ["zed", path], shell=False, creationflags=subprocess.CREATE_NO_WINDOW
-            )
+        subprocess.Popen(
+            self._launch_argv(path, is_ssh, ssh_host, ssh_user, ssh_port),
+            shell=False,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+        )
 
 
 if __name__ == "__main__":